@@ -1,9 +1,18 @@
 from flask import Flask, render_template, request, jsonify, session
+import click
 import requests
 import json
 import os
+import math
+import heapq
+import hmac
+import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 
+import cache
+
 app = Flask(__name__)
 app.secret_key = 'orutego_secret_key_2024'  # Change this in production
 
@@ -12,6 +21,332 @@ GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
 DISTANCE_MATRIX_URL = 'https://maps.googleapis.com/maps/api/distancematrix/json'
 DIRECTIONS_URL = 'https://maps.googleapis.com/maps/api/directions/json'
 
+# Distance Matrix API per-request limits
+MATRIX_MAX_ORIGINS = 25
+MATRIX_MAX_DESTINATIONS = 25
+MATRIX_MAX_ELEMENTS = 100
+
+# Non-candidate elements tolerated per origin when batching assign-nearest queries
+MATRIX_MAX_EXTRA_PER_ORIGIN = 1
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(origin_coords, dest_coords):
+    """Great-circle distance in km between two [lat, lng] points"""
+    lat1, lng1 = map(math.radians, origin_coords)
+    lat2, lng2 = map(math.radians, dest_coords)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def destination_radians(dest_coords_list):
+    """Precompute (lat_rad, lng_rad, cos_lat) per [lat, lng] destination for nearest_candidates"""
+    return [
+        (math.radians(lat), math.radians(lng), math.cos(math.radians(lat)))
+        for lat, lng in dest_coords_list
+    ]
+
+def nearest_candidates(origin_coords, dest_radians, k):
+    """Indices of the k destinations closest to the origin by straight-line distance
+
+    Args:
+        origin_coords: [lat, lng] of the origin in degrees
+        dest_radians: (lat_rad, lng_rad, cos_lat) tuples from destination_radians(),
+            so the trig terms are computed once per destination instead of once per pair
+        k: Number of candidates to return
+
+    Returns:
+        Destination indices, nearest first
+    """
+    lat1 = math.radians(origin_coords[0])
+    lng1 = math.radians(origin_coords[1])
+    cos_lat1 = math.cos(lat1)
+    scores = []
+    for idx, (lat2, lng2, cos_lat2) in enumerate(dest_radians):
+        # Haversine term is monotonic in distance, so it is enough for ranking
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + cos_lat1 * cos_lat2 * math.sin((lng2 - lng1) / 2) ** 2)
+        scores.append((a, idx))
+    return [idx for _, idx in heapq.nsmallest(k, scores)]
+
+def batch_candidate_pairs(candidates, max_extra_per_origin=MATRIX_MAX_EXTRA_PER_ORIGIN):
+    """Group origins into Distance Matrix batches within the per-request limits
+
+    Every element of a batch's origins x destinations grid is billed, so
+    origins are only merged when their candidate sets are identical or
+    nearly so. A batch may contain at most `max_extra_per_origin`
+    non-candidate elements per origin.
+
+    Args:
+        candidates: dict mapping origin index -> list of destination indices
+        max_extra_per_origin: Allowed non-candidate elements per origin
+
+    Returns:
+        List of (origin_indices, destination_indices) batches
+    """
+    # Origins with the same candidate set end up next to each other
+    ordered = sorted(candidates, key=lambda o: sorted(candidates[o]))
+    batches = []
+    batch_origins, batch_dests, batch_wanted = [], set(), 0
+    for origin_idx in ordered:
+        wanted = set(candidates[origin_idx])
+        merged = batch_dests | wanted
+        origin_count = len(batch_origins) + 1
+        elements = origin_count * len(merged)
+        fits = (origin_count <= MATRIX_MAX_ORIGINS
+                and len(merged) <= MATRIX_MAX_DESTINATIONS
+                and elements <= MATRIX_MAX_ELEMENTS
+                and elements - (batch_wanted + len(wanted)) <= max_extra_per_origin * origin_count)
+        if batch_origins and not fits:
+            batches.append((batch_origins, sorted(batch_dests)))
+            batch_origins, merged, batch_wanted = [], wanted, 0
+        batch_origins.append(origin_idx)
+        batch_dests = merged
+        batch_wanted += len(wanted)
+    if batch_origins:
+        batches.append((batch_origins, sorted(batch_dests)))
+    return batches
+
+# Travel modes accepted by the Distance Matrix API
+TRAVEL_MODES = ('driving', 'walking', 'bicycling', 'transit')
+
+# Background cache refresh: entries expiring within this window are re-fetched
+# if they were hit recently; expired entries without recent hits are deleted
+REFRESH_WINDOW_SECONDS = 24 * 3600
+REFRESH_HIT_WINDOW_SECONDS = cache.CACHE_TTL_SECONDS
+REFRESH_BATCH_LIMIT = 200
+REFRESH_REQUEST_DELAY = 0.5  # pause between API calls so user requests keep priority
+REFRESH_RETRY_SECONDS = 3600  # expiry pushed forward after a transient refresh failure
+
+def cache_call(func, *args, default=None):
+    """Call into the cache, treating SQLite faults as a miss so endpoints keep working"""
+    try:
+        return func(*args)
+    except sqlite3.Error as e:
+        app.logger.warning('Cache %s failed: %s', func.__name__, e)
+        cache.reset_schema_check()
+        return default
+
+def geocode_with_cache(address, api_key, prefetched=None):
+    """Geocode an address, serving repeated lookups from the persistent cache
+
+    Args:
+        prefetched: Optional result of cache.get_geocodes() covering this address,
+            so a batch of addresses costs one cache query
+
+    Returns:
+        Tuple of (coordinates, formatted_address, status)
+    """
+    if prefetched is not None:
+        cached = prefetched.get(cache.address_key(address))
+    else:
+        cached = cache_call(cache.get_geocode, address)
+    if cached:
+        return cached['coordinates'], cached['formatted_address'], 'OK'
+    
+    params = {'address': address, 'key': api_key}
+    response = requests.get(GEOCODE_URL, params=params)
+    data = response.json()
+    
+    if data['status'] != 'OK' or not data['results']:
+        return None, None, data.get('status', 'Unknown error')
+    
+    location = data['results'][0]['geometry']['location']
+    formatted_address = data['results'][0]['formatted_address']
+    cache_call(cache.put_geocodes, [(address, location['lat'], location['lng'], formatted_address)])
+    return [location['lat'], location['lng']], formatted_address, 'OK'
+
+def fetch_matrix(origin_coords_list, dest_coords_list, travel_mode, api_key):
+    """Request a Distance Matrix between coordinates and cache every OK element
+
+    Returns:
+        Matrix rows as returned by the API, or None if the request failed
+    """
+    matrix_params = {
+        'origins': '|'.join(f"{lat},{lng}" for lat, lng in origin_coords_list),
+        'destinations': '|'.join(f"{lat},{lng}" for lat, lng in dest_coords_list),
+        'mode': travel_mode,
+        'units': 'metric',
+        'key': api_key
+    }
+    
+    matrix_response = requests.get(DISTANCE_MATRIX_URL, params=matrix_params)
+    matrix_data = matrix_response.json()
+    
+    if matrix_data['status'] != 'OK' or not matrix_data['rows']:
+        return None
+    
+    entries = []
+    for origin, row in zip(origin_coords_list, matrix_data['rows']):
+        for dest, element in zip(dest_coords_list, row['elements']):
+            if element['status'] == 'OK':
+                entries.append((origin, dest, travel_mode,
+                                element['distance']['value'], element['duration']['value']))
+    cache_call(cache.put_routes, entries)
+    return matrix_data['rows']
+
+def route_element(origin_coords, dest_coords, travel_mode, api_key, prefetched=None):
+    """Distance Matrix element for one origin/destination pair, served from the cache when possible
+
+    Args:
+        prefetched: Optional result of cache.get_routes() covering this pair,
+            so a batch of pairs costs one cache query
+
+    Returns:
+        Element as returned by the API, or None if the request failed
+    """
+    if prefetched is not None:
+        cached_route = prefetched.get((cache.coords_key(origin_coords), cache.coords_key(dest_coords)))
+    else:
+        cached_route = cache_call(cache.get_route, origin_coords, dest_coords, travel_mode)
+    if cached_route:
+        return {
+            'status': 'OK',
+            'distance': {'value': cached_route['distance_m']},
+            'duration': {'value': cached_route['duration_s']}
+        }
+    
+    matrix_rows = fetch_matrix([origin_coords], [dest_coords], travel_mode, api_key)
+    return matrix_rows[0]['elements'][0] if matrix_rows else None
+
+def warm_geocodes(addresses, api_key):
+    """Geocode addresses missing from the cache and store them in bulk
+
+    Returns:
+        Tuple of (number cached, list of failed addresses)
+    """
+    entries = []
+    failed = []
+    for addr in dict.fromkeys(a.strip() for a in addresses if isinstance(a, str) and a.strip()):
+        if cache.get_geocode(addr):
+            continue
+        
+        params = {'address': addr, 'key': api_key}
+        try:
+            data = requests.get(GEOCODE_URL, params=params).json()
+        except Exception:
+            failed.append(addr)
+            continue
+        
+        if data['status'] != 'OK' or not data['results']:
+            failed.append(addr)
+            continue
+        
+        location = data['results'][0]['geometry']['location']
+        entries.append((addr, location['lat'], location['lng'], data['results'][0]['formatted_address']))
+    
+    return cache.put_geocodes(entries), failed
+
+def refresh_expiring_entries(api_key, within_seconds=REFRESH_WINDOW_SECONDS,
+                             hit_within_seconds=REFRESH_HIT_WINDOW_SECONDS,
+                             limit=REFRESH_BATCH_LIMIT, delay=REFRESH_REQUEST_DELAY):
+    """Re-fetch recently used cache entries that are close to expiry
+
+    Expired entries that were not hit within `hit_within_seconds` are deleted
+    instead, so API spend follows traffic rather than cache size. Routes are
+    batched per travel mode with the same limits as assign-nearest.
+
+    Entries that no longer resolve are deleted; entries that fail for a
+    transient reason (network, quota) have their expiry pushed forward by
+    REFRESH_RETRY_SECONDS so they do not block the rest of the queue.
+
+    Returns:
+        Dictionary with the number of geocodes and routes refreshed, entries
+        purged as unused, entries dropped and entries deferred
+    """
+    refreshed = {'geocodes': 0, 'routes': 0, 'purged': cache.purge_unused(hit_within_seconds),
+                 'dropped': 0, 'deferred': 0}
+    drop_addresses, defer_addresses = [], []
+    drop_routes, defer_routes = [], []
+    
+    for addr in cache.expiring_geocodes(within_seconds, hit_within_seconds, limit):
+        params = {'address': addr, 'key': api_key}
+        try:
+            data = requests.get(GEOCODE_URL, params=params).json()
+        except Exception:
+            defer_addresses.append(addr)
+            continue
+        
+        if data['status'] == 'OK' and data['results']:
+            location = data['results'][0]['geometry']['location']
+            refreshed['geocodes'] += cache.put_geocodes(
+                [(addr, location['lat'], location['lng'], data['results'][0]['formatted_address'])])
+        elif data['status'] in ('OK', 'ZERO_RESULTS'):
+            drop_addresses.append(addr)
+        else:
+            defer_addresses.append(addr)
+        time.sleep(delay)
+    
+    by_mode = {}
+    for origin, dest, mode in cache.expiring_routes(within_seconds, hit_within_seconds, limit):
+        by_mode.setdefault(mode, []).append((tuple(origin), tuple(dest)))
+    
+    for mode, pairs in by_mode.items():
+        origins = list(dict.fromkeys(origin for origin, _ in pairs))
+        dests = list(dict.fromkeys(dest for _, dest in pairs))
+        origin_index = {origin: i for i, origin in enumerate(origins)}
+        dest_index = {dest: i for i, dest in enumerate(dests)}
+        
+        wanted = {}
+        for origin, dest in pairs:
+            wanted.setdefault(origin_index[origin], []).append(dest_index[dest])
+        
+        # Split origins with many expiring destinations so each fits one request
+        candidates = {}
+        for origin_idx, dest_ids in wanted.items():
+            for start in range(0, len(dest_ids), MATRIX_MAX_DESTINATIONS):
+                candidates[(origin_idx, start)] = dest_ids[start:start + MATRIX_MAX_DESTINATIONS]
+        
+        for batch_keys, batch_dests in batch_candidate_pairs(candidates):
+            try:
+                rows = fetch_matrix([origins[key[0]] for key in batch_keys],
+                                    [dests[d] for d in batch_dests], mode, api_key)
+            except Exception:
+                rows = None
+            
+            for row_idx, key in enumerate(batch_keys):
+                allowed = set(candidates[key])
+                elements = rows[row_idx]['elements'] if rows else [None] * len(batch_dests)
+                for dest_idx, element in zip(batch_dests, elements):
+                    if dest_idx not in allowed:
+                        continue
+                    route = (origins[key[0]], dests[dest_idx], mode)
+                    if element is None:
+                        defer_routes.append(route)
+                    elif element['status'] == 'OK':
+                        refreshed['routes'] += 1
+                    else:
+                        # NOT_FOUND, ZERO_RESULTS, ...: the route no longer exists
+                        drop_routes.append(route)
+            time.sleep(delay)
+    
+    if drop_addresses or drop_routes:
+        refreshed['dropped'] = cache.delete_entries(drop_addresses, drop_routes)
+    if defer_addresses or defer_routes:
+        cache.defer_expiry(REFRESH_RETRY_SECONDS, defer_addresses, defer_routes)
+        refreshed['deferred'] = len(defer_addresses) + len(defer_routes)
+    
+    return refreshed
+
+def run_cache_refresher(api_key, interval):
+    """Refresh entries close to expiry every `interval` seconds, forever"""
+    while True:
+        try:
+            refreshed = refresh_expiring_entries(api_key)
+            app.logger.info('Cache refresh: %d geocodes, %d routes, %d purged, %d dropped, %d deferred',
+                            refreshed['geocodes'], refreshed['routes'], refreshed['purged'],
+                            refreshed['dropped'], refreshed['deferred'])
+        except Exception as e:
+            app.logger.warning('Cache refresh failed: %s', e)
+        time.sleep(interval)
+
+def start_cache_refresher(api_key, interval):
+    """Run the cache refresher in a daemon thread alongside the web server"""
+    thread = threading.Thread(target=run_cache_refresher, args=(api_key, interval),
+                              name='cache-refresher', daemon=True)
+    thread.start()
+    return thread
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -49,24 +384,17 @@ def geocode_address():
         if not api_key:
             return jsonify({'success': False, 'error': 'API key not found. Please save your API key first.'})
         
-        # Make request to Google Geocoding API
-        params = {
-            'address': address,
-            'key': api_key
-        }
+        # Geocode via cache, falling back to Google Geocoding API
+        coords, formatted_address, status = geocode_with_cache(address, api_key)
         
-        response = requests.get(GEOCODE_URL, params=params)
-        data = response.json()
-        
-        if data['status'] == 'OK' and data['results']:
-            location = data['results'][0]['geometry']['location']
+        if coords:
             return jsonify({
                 'success': True,
-                'coordinates': [location['lat'], location['lng']],
-                'formatted_address': data['results'][0]['formatted_address']
+                'coordinates': coords,
+                'formatted_address': formatted_address
             })
         else:
-            return jsonify({'success': False, 'error': f'Geocoding failed: {data.get("status", "Unknown error")}'})
+            return jsonify({'success': False, 'error': f'Geocoding failed: {status}'})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -90,16 +418,20 @@ def mass_route():
         if not api_key:
             return jsonify({'success': False, 'error': 'API key not found. Please save your API key first.'})
         
+        # Look up every address in the cache with a single query
+        clean_origins = [addr.strip() for addr in origins if addr and addr.strip()]
+        cached_geocodes = cache_call(cache.get_geocodes, [destination] + clean_origins, default={})
+        
         # Geocode destination once (shared for all origins)
-        dest_params = {'address': destination, 'key': api_key}
-        dest_response = requests.get(GEOCODE_URL, params=dest_params)
-        dest_data = dest_response.json()
+        dest_coords, _, dest_status = geocode_with_cache(destination, api_key, cached_geocodes)
         
-        if dest_data['status'] != 'OK' or not dest_data['results']:
-            return jsonify({'success': False, 'error': f'Could not geocode destination: {dest_data.get("status", "Unknown error")}'})
+        if not dest_coords:
+            return jsonify({'success': False, 'error': f'Could not geocode destination: {dest_status}'})
         
-        dest_location = dest_data['results'][0]['geometry']['location']
-        dest_coords = [dest_location['lat'], dest_location['lng']]
+        # Origins with a cached geocode have known coordinates, so their routes are looked up together
+        cached_routes = cache_call(cache.get_routes,
+                                   [(geocode['coordinates'], dest_coords) for geocode in cached_geocodes.values()],
+                                   travel_mode, default={})
         
         results = []
         
@@ -111,36 +443,21 @@ def mass_route():
             
             try:
                 # Geocode origin
-                origin_params = {'address': clean_addr, 'key': api_key}
-                origin_response = requests.get(GEOCODE_URL, params=origin_params)
-                origin_data = origin_response.json()
+                origin_coords, _, origin_status = geocode_with_cache(clean_addr, api_key, cached_geocodes)
                 
-                if origin_data['status'] != 'OK' or not origin_data['results']:
+                if not origin_coords:
                     results.append({
                         'input_address': clean_addr,
                         'success': False,
-                        'error': origin_data.get("status", "Unknown error")
+                        'error': origin_status
                     })
                     continue
                 
-                origin_location = origin_data['results'][0]['geometry']['location']
-                origin_coords = [origin_location['lat'], origin_location['lng']]
+                # Calculate distance and time, using the cache before the Distance Matrix API
+                prefetched = cached_routes if cache.address_key(clean_addr) in cached_geocodes else None
+                element = route_element(origin_coords, dest_coords, travel_mode, api_key, prefetched)
                 
-                # Calculate distance and time using Distance Matrix API
-                matrix_params = {
-                    'origins': f"{origin_coords[0]},{origin_coords[1]}",
-                    'destinations': f"{dest_coords[0]},{dest_coords[1]}",
-                    'mode': travel_mode,
-                    'units': 'metric',
-                    'key': api_key
-                }
-                
-                matrix_response = requests.get(DISTANCE_MATRIX_URL, params=matrix_params)
-                matrix_data = matrix_response.json()
-                
-                if matrix_data['status'] == 'OK' and matrix_data['rows']:
-                    element = matrix_data['rows'][0]['elements'][0]
-                    
+                if element:
                     if element['status'] == 'OK':
                         distance_km = element['distance']['value'] / 1000
                         duration_seconds = element['duration']['value']
@@ -185,6 +502,186 @@ def mass_route():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/assign-nearest', methods=['POST'])
+def assign_nearest():
+    """Assign each origin to the destination with the shortest travel time"""
+    try:
+        data = request.get_json()
+        origins = data.get('origins', [])
+        destinations = data.get('destinations', [])
+        travel_mode = data.get('travelMode', 'driving').lower()
+        top_k = data.get('topK', 3)
+        
+        if not origins:
+            return jsonify({'success': False, 'error': 'No origin addresses provided'})
+        
+        if not destinations:
+            return jsonify({'success': False, 'error': 'No destination addresses provided'})
+        
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+            return jsonify({'success': False, 'error': 'topK must be a positive integer'})
+        
+        # A single matrix request cannot hold more candidates than this
+        top_k = min(top_k, MATRIX_MAX_DESTINATIONS)
+        
+        api_key = session.get('google_maps_api_key')
+        if not api_key:
+            return jsonify({'success': False, 'error': 'API key not found. Please save your API key first.'})
+        
+        # Look up every address in the cache with a single query
+        cached_geocodes = cache_call(
+            cache.get_geocodes,
+            [addr.strip() for addr in list(destinations) + list(origins) if addr and addr.strip()],
+            default={})
+        
+        # Geocode destinations once (shared for all origins)
+        dest_addresses = []
+        dest_coords = []
+        dest_errors = []
+        for addr in destinations:
+            if not addr or not addr.strip():
+                continue
+            
+            clean_addr = addr.strip()
+            coords, _, dest_status = geocode_with_cache(clean_addr, api_key, cached_geocodes)
+            
+            if not coords:
+                dest_errors.append({
+                    'input_address': clean_addr,
+                    'error': dest_status
+                })
+                continue
+            
+            dest_addresses.append(clean_addr)
+            dest_coords.append(coords)
+        
+        if not dest_coords:
+            return jsonify({'success': False, 'error': 'Could not geocode any destination', 'destinationErrors': dest_errors})
+        
+        dest_radians = destination_radians(dest_coords)
+        
+        results = []
+        origin_coords = {}
+        nearest = {}
+        candidates = {}
+        best = {}
+        elements_requested = 0
+        
+        for addr in origins:
+            if not addr or not addr.strip():
+                continue
+            
+            clean_addr = addr.strip()
+            
+            try:
+                coords, _, origin_status = geocode_with_cache(clean_addr, api_key, cached_geocodes)
+                
+                if not coords:
+                    results.append({
+                        'input_address': clean_addr,
+                        'success': False,
+                        'error': origin_status
+                    })
+                    continue
+                
+                # Rank destinations by straight-line distance and keep the top k
+                origin_idx = len(results)
+                origin_coords[origin_idx] = coords
+                results.append({
+                    'input_address': clean_addr,
+                    'success': False,
+                    'error': 'No route found to any candidate destination'
+                })
+                
+                nearest[origin_idx] = nearest_candidates(coords, dest_radians, top_k)
+            
+            except Exception as req_err:
+                results.append({
+                    'input_address': clean_addr,
+                    'success': False,
+                    'error': str(req_err)
+                })
+        
+        # Candidates already in the route cache need no matrix element; look them all up at once
+        cached_routes = cache_call(
+            cache.get_routes,
+            [(origin_coords[o], dest_coords[d]) for o, dest_ids in nearest.items() for d in dest_ids],
+            travel_mode, default={})
+        
+        for origin_idx, dest_ids in nearest.items():
+            origin_key = cache.coords_key(origin_coords[origin_idx])
+            missing = []
+            for dest_idx in dest_ids:
+                cached_route = cached_routes.get((origin_key, cache.coords_key(dest_coords[dest_idx])))
+                if not cached_route:
+                    missing.append(dest_idx)
+                elif origin_idx not in best or cached_route['duration_s'] < best[origin_idx][0]:
+                    best[origin_idx] = (cached_route['duration_s'], cached_route['distance_m'], dest_idx)
+            if missing:
+                candidates[origin_idx] = missing
+        
+        # Query real travel times only for each origin's uncached candidates
+        for batch_origins, batch_dests in batch_candidate_pairs(candidates):
+            elements_requested += len(batch_origins) * len(batch_dests)
+            
+            try:
+                matrix_rows = fetch_matrix([origin_coords[o] for o in batch_origins],
+                                           [dest_coords[d] for d in batch_dests],
+                                           travel_mode, api_key)
+            except Exception as req_err:
+                for origin_idx in batch_origins:
+                    results[origin_idx]['error'] = str(req_err)
+                continue
+            
+            if not matrix_rows:
+                for origin_idx in batch_origins:
+                    results[origin_idx]['error'] = 'Distance Matrix API request failed'
+                continue
+            
+            for row_idx, origin_idx in enumerate(batch_origins):
+                elements = matrix_rows[row_idx]['elements']
+                allowed = set(candidates[origin_idx])
+                
+                for col_idx, dest_idx in enumerate(batch_dests):
+                    element = elements[col_idx]
+                    if dest_idx not in allowed or element['status'] != 'OK':
+                        continue
+                    
+                    duration_seconds = element['duration']['value']
+                    if origin_idx not in best or duration_seconds < best[origin_idx][0]:
+                        best[origin_idx] = (duration_seconds, element['distance']['value'], dest_idx)
+        
+        for origin_idx, (duration_seconds, distance_m, dest_idx) in best.items():
+            distance_km = distance_m / 1000
+            
+            duration_minutes = duration_seconds / 60
+            hours = int(duration_minutes // 60)
+            minutes = int(duration_minutes % 60)
+            duration_formatted = f"{hours:02d}:{minutes:02d}"
+            decimal_hours = round(hours + (minutes / 60), 2)
+            
+            results[origin_idx] = {
+                'input_address': results[origin_idx]['input_address'],
+                'success': True,
+                'destinationAddress': dest_addresses[dest_idx],
+                'originCoords': origin_coords[origin_idx],
+                'destinationCoords': dest_coords[dest_idx],
+                'straightLineDistance': round(haversine_km(origin_coords[origin_idx], dest_coords[dest_idx]), 2),
+                'distance': round(distance_km, 2),
+                'duration': duration_formatted,
+                'decimalHours': decimal_hours
+            }
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'destinationErrors': dest_errors,
+            'elementsRequested': elements_requested
+        })
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/calculate', methods=['POST'])
 def calculate_route():
     """Calculate distance and time between two addresses"""
@@ -202,46 +699,18 @@ def calculate_route():
             return jsonify({'success': False, 'error': 'API key not found. Please save your API key first.'})
         
         # First geocode both addresses
-        origin_coords = None
-        dest_coords = None
-        
-        # Geocode origin
-        geocode_params = {'address': origin, 'key': api_key}
-        geocode_response = requests.get(GEOCODE_URL, params=geocode_params)
-        geocode_data = geocode_response.json()
-        
-        if geocode_data['status'] == 'OK' and geocode_data['results']:
-            origin_location = geocode_data['results'][0]['geometry']['location']
-            origin_coords = [origin_location['lat'], origin_location['lng']]
-        else:
+        origin_coords, _, _ = geocode_with_cache(origin, api_key)
+        if not origin_coords:
             return jsonify({'success': False, 'error': 'Could not geocode origin address'})
         
-        # Geocode destination
-        geocode_params = {'address': destination, 'key': api_key}
-        geocode_response = requests.get(GEOCODE_URL, params=geocode_params)
-        geocode_data = geocode_response.json()
-        
-        if geocode_data['status'] == 'OK' and geocode_data['results']:
-            dest_location = geocode_data['results'][0]['geometry']['location']
-            dest_coords = [dest_location['lat'], dest_location['lng']]
-        else:
+        dest_coords, _, _ = geocode_with_cache(destination, api_key)
+        if not dest_coords:
             return jsonify({'success': False, 'error': 'Could not geocode destination address'})
         
-        # Calculate distance and time using Distance Matrix API
-        matrix_params = {
-            'origins': origin,
-            'destinations': destination,
-            'mode': travel_mode,
-            'units': 'metric',
-            'key': api_key
-        }
-        
-        matrix_response = requests.get(DISTANCE_MATRIX_URL, params=matrix_params)
-        matrix_data = matrix_response.json()
+        # Calculate distance and time, using the route cache before the Distance Matrix API
+        element = route_element(origin_coords, dest_coords, travel_mode, api_key)
         
-        if matrix_data['status'] == 'OK' and matrix_data['rows']:
-            element = matrix_data['rows'][0]['elements'][0]
-            
+        if element:
             if element['status'] == 'OK':
                 distance_km = element['distance']['value'] / 1000  # Convert meters to km
                 duration_seconds = element['duration']['value']
@@ -255,10 +724,10 @@ def calculate_route():
                 # Calculate decimal hours more precisely: hours + (minutes/60)
                 decimal_hours = round(hours + (minutes / 60), 2)
                 
-                # Get route polyline for map display
+                # Get route polyline for map display, between the same coordinates as the distance/time
                 directions_params = {
-                    'origin': origin,
-                    'destination': destination,
+                    'origin': cache.coords_key(origin_coords),
+                    'destination': cache.coords_key(dest_coords),
                     'mode': travel_mode,
                     'key': api_key
                 }
@@ -293,6 +762,65 @@ def calculate_route():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/admin/warm-cache', methods=['POST'])
+def warm_cache():
+    """Bulk-load route exports and address lists into the persistent cache"""
+    try:
+        admin_token = os.environ.get('ORUTEGO_ADMIN_TOKEN')
+        if not admin_token:
+            return jsonify({'success': False, 'error': 'Cache warm-up is disabled. Set ORUTEGO_ADMIN_TOKEN to enable it.'}), 403
+        
+        provided_token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(provided_token.encode('utf-8'), admin_token.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Invalid admin token'}), 403
+        
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Request body must be a JSON object'}), 400
+        
+        route_csv = data.get('routeCsv') or ''
+        addresses = data.get('addresses') or []
+        travel_mode = str(data.get('travelMode', 'driving')).lower()
+        
+        if not isinstance(route_csv, str) or not isinstance(addresses, list):
+            return jsonify({'success': False, 'error': 'routeCsv must be a string and addresses a list'}), 400
+        
+        if travel_mode not in TRAVEL_MODES:
+            return jsonify({'success': False, 'error': f'travelMode must be one of: {", ".join(TRAVEL_MODES)}'}), 400
+        
+        if not route_csv and not addresses:
+            return jsonify({'success': False, 'error': 'Provide routeCsv and/or addresses to preload'}), 400
+        
+        api_key = session.get('google_maps_api_key') or os.environ.get('GOOGLE_MAPS_API_KEY')
+        if addresses and not api_key:
+            return jsonify({'success': False, 'error': 'API key not found. Please save your API key first.'})
+        
+        route_entries, routes_skipped = cache.parse_route_export(route_csv, travel_mode)
+        if route_csv.strip() and not route_entries:
+            return jsonify({
+                'success': False,
+                'error': 'No valid rows found in routeCsv. Expected a Mass Route CSV export.',
+                'routesSkipped': routes_skipped
+            }), 400
+        
+        routes_loaded = cache.put_routes(route_entries)
+        
+        geocodes_loaded = 0
+        failed = []
+        if addresses:
+            geocodes_loaded, failed = warm_geocodes(addresses, api_key)
+        
+        return jsonify({
+            'success': True,
+            'routesLoaded': routes_loaded,
+            'routesSkipped': routes_skipped,
+            'geocodesLoaded': geocodes_loaded,
+            'failedAddresses': failed
+        })
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/get-cached-result')
 def get_cached_result():
     """Get the last cached calculation result"""
@@ -310,5 +838,52 @@ def not_found_error(error):
 def internal_error(error):
     return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+@app.cli.command('warm-cache')
+@click.option('--routes', 'route_files', multiple=True, type=click.File('r', encoding='utf-8'),
+              help='Mass Route CSV export to preload (repeatable)')
+@click.option('--addresses', 'address_files', multiple=True, type=click.File('r', encoding='utf-8'),
+              help='Text file with one address per line to geocode (repeatable)')
+@click.option('--mode', 'travel_mode', default='driving', show_default=True,
+              type=click.Choice(TRAVEL_MODES, case_sensitive=False),
+              help='Travel mode the route exports were calculated with')
+@click.option('--refresh', is_flag=True, help='Re-fetch entries close to expiry once')
+@click.option('--schedule', type=click.IntRange(min=1), default=None, metavar='SECONDS',
+              help='Keep running, refreshing entries close to expiry every SECONDS')
+def warm_cache_command(route_files, address_files, travel_mode, refresh, schedule):
+    """Preload the geocode/route cache from previous exports and address lists"""
+    api_key = os.environ.get('GOOGLE_MAPS_API_KEY')
+    if (address_files or refresh or schedule) and not api_key:
+        raise click.UsageError('GOOGLE_MAPS_API_KEY must be set to geocode or refresh entries')
+    
+    for route_file in route_files:
+        csv_text = route_file.read()
+        entries, skipped = cache.parse_route_export(csv_text, travel_mode.lower())
+        if csv_text.strip() and not entries:
+            raise click.ClickException(f'{route_file.name}: no valid rows found ({skipped} skipped). '
+                                       'Expected a Mass Route CSV export.')
+        loaded = cache.put_routes(entries)
+        click.echo(f'{route_file.name}: {loaded} routes loaded, {skipped} rows skipped')
+    
+    for address_file in address_files:
+        loaded, failed = warm_geocodes(address_file.read().splitlines(), api_key)
+        click.echo(f'{address_file.name}: {loaded} addresses geocoded, {len(failed)} failed')
+    
+    if refresh:
+        refreshed = refresh_expiring_entries(api_key)
+        click.echo(f"Refreshed {refreshed['geocodes']} geocodes, {refreshed['routes']} routes, "
+                   f"purged {refreshed['purged']} unused entries, dropped {refreshed['dropped']}, "
+                   f"deferred {refreshed['deferred']}")
+    
+    if schedule:
+        # Background job: stay out of the way of the web server
+        if hasattr(os, 'nice'):
+            os.nice(10)
+        click.echo(f'Refreshing entries close to expiry every {schedule}s (Ctrl+C to stop)')
+        run_cache_refresher(api_key, schedule)
+
 if __name__ == '__main__':
+    # Optional in-process refresher; skip the reloader's parent process
+    refresh_interval = int(os.environ.get('ORUTEGO_CACHE_REFRESH_INTERVAL', 0))
+    if refresh_interval and os.environ.get('GOOGLE_MAPS_API_KEY') and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_cache_refresher(os.environ['GOOGLE_MAPS_API_KEY'], refresh_interval)
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,405 @@
+"""
+Persistent geocode and route cache for the orutego application
+Backed by SQLite so warm entries survive restarts and can be bulk-loaded offline
+"""
+
+import csv
+import io
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CACHE_DB_PATH = os.environ.get('ORUTEGO_CACHE_DB', 'orutego_cache.db')
+CACHE_TTL_SECONDS = int(os.environ.get('ORUTEGO_CACHE_TTL', 7 * 24 * 3600))  # 7 days
+
+# Rows written per transaction during bulk loads
+BULK_BATCH_SIZE = 500
+
+# Keys per SELECT ... IN lookup, well below SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    address TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    formatted_address TEXT,
+    expires_at REAL NOT NULL,
+    last_hit REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS routes (
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    distance_m INTEGER NOT NULL,
+    duration_s INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_hit REAL NOT NULL,
+    PRIMARY KEY (origin, destination, mode)
+);
+CREATE INDEX IF NOT EXISTS geocodes_expiry ON geocodes (expires_at);
+CREATE INDEX IF NOT EXISTS routes_expiry ON routes (expires_at);
+"""
+
+
+_initialized_paths = set()
+_local = threading.local()
+
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Connection to the cache database for the current thread
+
+    Connections are reused so a lookup costs one query instead of an
+    open/close (closing the last WAL connection checkpoints the database).
+    The schema is created once per process, and again if the cache file
+    was flushed/deleted.
+    """
+    path = db_path or CACHE_DB_PATH
+    try:
+        inode = os.stat(path).st_ino
+    except OSError:
+        inode = None
+
+    connections = _local.__dict__.setdefault('connections', {})
+    cached = connections.get(path)
+    if cached is not None and cached[1] == inode and inode is not None and path in _initialized_paths:
+        return cached[0]
+
+    # First use in this thread, or the file was replaced/deleted since we opened it
+    if cached is not None:
+        cached[0].close()
+    conn = sqlite3.connect(path, timeout=30)
+    # A cache can lose its last commits on power loss; skip the fsync on every hit
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if inode is None or path not in _initialized_paths:
+        conn.execute('PRAGMA journal_mode=WAL')  # readers are not blocked by bulk writes
+        conn.executescript(SCHEMA)
+        _initialized_paths.add(path)
+    connections[path] = (conn, os.stat(path).st_ino)
+    return conn
+
+
+def reset_schema_check(db_path: Optional[str] = None) -> None:
+    """Force the next connection to reconnect and re-create the schema, e.g. after a SQLite error"""
+    _initialized_paths.discard(db_path or CACHE_DB_PATH)
+
+
+def address_key(address: str) -> str:
+    """Normalize an address so trivially different spellings share one entry"""
+    return ' '.join(address.split()).lower()
+
+
+def coords_key(coords: Sequence[float]) -> str:
+    """Format coordinates with the same 6-decimal precision as the CSV export"""
+    return f"{float(coords[0]):.6f},{float(coords[1]):.6f}"
+
+
+def _parse_coords_key(key: str) -> List[float]:
+    lat, lng = key.split(',')
+    return [float(lat), float(lng)]
+
+
+def _batches(rows: List[tuple], size: int) -> Iterable[List[tuple]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def get_geocode(address: str, db_path: Optional[str] = None) -> Optional[Dict]:
+    """
+    Look up a cached geocode result and record the hit
+
+    Args:
+        address: The address as entered by the user
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Dictionary with coordinates and formatted_address or None if missing/expired
+    """
+    return get_geocodes([address], db_path=db_path).get(address_key(address))
+
+
+def get_geocodes(addresses: Iterable[str], db_path: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Look up many cached geocode results on one connection and record the hits
+
+    Args:
+        addresses: Addresses as entered by the user
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Dictionary mapping address_key(address) -> {coordinates, formatted_address}
+        for every address that is cached and not expired
+    """
+    keys = list(dict.fromkeys(address_key(address) for address in addresses))
+    now = time.time()
+    found = {}
+    conn = _connect(db_path)
+    for chunk in _batches(keys, LOOKUP_CHUNK_SIZE):
+        rows = conn.execute(
+            'SELECT address, lat, lng, formatted_address FROM geocodes'
+            f' WHERE expires_at > ? AND address IN ({", ".join("?" * len(chunk))})',
+            [now] + chunk
+        ).fetchall()
+        for key, lat, lng, formatted in rows:
+            found[key] = {'coordinates': [lat, lng], 'formatted_address': formatted}
+    if found:
+        with conn:
+            conn.executemany('UPDATE geocodes SET last_hit = ? WHERE address = ?',
+                             [(now, key) for key in found])
+    return found
+
+
+def put_geocodes(entries: Iterable[Tuple[str, float, float, Optional[str]]],
+                 db_path: Optional[str] = None,
+                 batch_size: int = BULK_BATCH_SIZE) -> int:
+    """
+    Store geocode results, one transaction per batch
+
+    New entries count as hit now; replacing an entry keeps its last hit.
+
+    Args:
+        entries: Iterable of (address, lat, lng, formatted_address)
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+        batch_size: Number of rows written per transaction
+
+    Returns:
+        Number of entries written
+    """
+    now = time.time()
+    expires_at = now + CACHE_TTL_SECONDS
+    rows = [(address_key(address), lat, lng, formatted, expires_at, now)
+            for address, lat, lng, formatted in entries]
+    conn = _connect(db_path)
+    for batch in _batches(rows, batch_size):
+        with conn:
+            conn.executemany(
+                'INSERT INTO geocodes VALUES (?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (address) DO UPDATE SET'
+                ' lat = excluded.lat, lng = excluded.lng,'
+                ' formatted_address = excluded.formatted_address, expires_at = excluded.expires_at',
+                batch
+            )
+    return len(rows)
+
+
+def get_route(origin_coords: Sequence[float], dest_coords: Sequence[float],
+              mode: str, db_path: Optional[str] = None) -> Optional[Dict]:
+    """
+    Look up a cached route between two coordinates and record the hit
+
+    Args:
+        origin_coords: [lat, lng] of the origin
+        dest_coords: [lat, lng] of the destination
+        mode: Travel mode (driving, walking, bicycling, transit)
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Dictionary with distance_m and duration_s or None if missing/expired
+    """
+    found = get_routes([(origin_coords, dest_coords)], mode, db_path=db_path)
+    return found.get((coords_key(origin_coords), coords_key(dest_coords)))
+
+
+def get_routes(pairs: Iterable[Tuple[Sequence[float], Sequence[float]]], mode: str,
+               db_path: Optional[str] = None) -> Dict[Tuple[str, str], Dict]:
+    """
+    Look up many cached routes on one connection and record the hits
+
+    Args:
+        pairs: Iterable of (origin_coords, dest_coords)
+        mode: Travel mode (driving, walking, bicycling, transit)
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Dictionary mapping (coords_key(origin), coords_key(dest)) -> {distance_m, duration_s}
+        for every pair that is cached and not expired
+    """
+    keys = list(dict.fromkeys((coords_key(origin), coords_key(dest)) for origin, dest in pairs))
+    now = time.time()
+    found = {}
+    conn = _connect(db_path)
+    for chunk in _batches(keys, LOOKUP_CHUNK_SIZE):
+        rows = conn.execute(
+            'SELECT origin, destination, distance_m, duration_s FROM routes'
+            ' WHERE mode = ? AND expires_at > ?'
+            f' AND (origin, destination) IN (VALUES {", ".join(["(?, ?)"] * len(chunk))})',
+            [mode, now] + [value for key in chunk for value in key]
+        ).fetchall()
+        for origin, dest, distance_m, duration_s in rows:
+            found[(origin, dest)] = {'distance_m': distance_m, 'duration_s': duration_s}
+    if found:
+        with conn:
+            conn.executemany(
+                'UPDATE routes SET last_hit = ? WHERE origin = ? AND destination = ? AND mode = ?',
+                [(now, origin, dest, mode) for origin, dest in found]
+            )
+    return found
+
+
+def put_routes(entries: Iterable[Tuple[Sequence[float], Sequence[float], str, int, int]],
+               db_path: Optional[str] = None,
+               batch_size: int = BULK_BATCH_SIZE) -> int:
+    """
+    Store route results, one transaction per batch
+
+    New entries count as hit now; replacing an entry keeps its last hit.
+
+    Args:
+        entries: Iterable of (origin_coords, dest_coords, mode, distance_m, duration_s)
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+        batch_size: Number of rows written per transaction
+
+    Returns:
+        Number of entries written
+    """
+    now = time.time()
+    expires_at = now + CACHE_TTL_SECONDS
+    rows = [(coords_key(origin), coords_key(dest), mode, int(distance_m), int(duration_s), expires_at, now)
+            for origin, dest, mode, distance_m, duration_s in entries]
+    conn = _connect(db_path)
+    for batch in _batches(rows, batch_size):
+        with conn:
+            conn.executemany(
+                'INSERT INTO routes VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (origin, destination, mode) DO UPDATE SET'
+                ' distance_m = excluded.distance_m, duration_s = excluded.duration_s,'
+                ' expires_at = excluded.expires_at',
+                batch
+            )
+    return len(rows)
+
+
+def expiring_geocodes(within_seconds: int, hit_within_seconds: int, limit: int,
+                      db_path: Optional[str] = None) -> List[str]:
+    """Recently hit addresses whose entry expires within the given window, soonest first"""
+    now = time.time()
+    conn = _connect(db_path)
+    rows = conn.execute(
+        'SELECT address FROM geocodes WHERE expires_at <= ? AND last_hit >= ?'
+        ' ORDER BY expires_at LIMIT ?',
+        (now + within_seconds, now - hit_within_seconds, limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def expiring_routes(within_seconds: int, hit_within_seconds: int, limit: int,
+                    db_path: Optional[str] = None) -> List[Tuple[List[float], List[float], str]]:
+    """Recently hit (origin_coords, dest_coords, mode) whose entry expires within the given window, soonest first"""
+    now = time.time()
+    conn = _connect(db_path)
+    rows = conn.execute(
+        'SELECT origin, destination, mode FROM routes WHERE expires_at <= ? AND last_hit >= ?'
+        ' ORDER BY expires_at LIMIT ?',
+        (now + within_seconds, now - hit_within_seconds, limit)
+    ).fetchall()
+    return [(_parse_coords_key(origin), _parse_coords_key(dest), mode) for origin, dest, mode in rows]
+
+
+def purge_unused(hit_within_seconds: int, db_path: Optional[str] = None) -> int:
+    """
+    Delete expired entries that have not been hit recently
+
+    Args:
+        hit_within_seconds: Entries hit within this many seconds are kept
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Number of entries deleted
+    """
+    now = time.time()
+    params = (now, now - hit_within_seconds)
+    conn = _connect(db_path)
+    with conn:
+        deleted = conn.execute('DELETE FROM geocodes WHERE expires_at <= ? AND last_hit < ?', params).rowcount
+        deleted += conn.execute('DELETE FROM routes WHERE expires_at <= ? AND last_hit < ?', params).rowcount
+    return deleted
+
+
+def delete_entries(addresses: Iterable[str] = (),
+                   routes: Iterable[Tuple[Sequence[float], Sequence[float], str]] = (),
+                   db_path: Optional[str] = None) -> int:
+    """
+    Delete geocodes and routes, e.g. ones that no longer resolve
+
+    Args:
+        addresses: Addresses whose geocode entry is deleted
+        routes: Iterable of (origin_coords, dest_coords, mode) whose route entry is deleted
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+
+    Returns:
+        Number of entries deleted
+    """
+    geocode_keys = [(address_key(address),) for address in addresses]
+    route_keys = [(coords_key(origin), coords_key(dest), mode) for origin, dest, mode in routes]
+    conn = _connect(db_path)
+    with conn:
+        deleted = conn.executemany('DELETE FROM geocodes WHERE address = ?', geocode_keys).rowcount
+        deleted += conn.executemany(
+            'DELETE FROM routes WHERE origin = ? AND destination = ? AND mode = ?', route_keys
+        ).rowcount
+    return max(deleted, 0)
+
+
+def defer_expiry(seconds: int, addresses: Iterable[str] = (),
+                 routes: Iterable[Tuple[Sequence[float], Sequence[float], str]] = (),
+                 db_path: Optional[str] = None) -> None:
+    """
+    Push expiry forward so entries that failed to refresh stop blocking the refresh queue
+
+    Args:
+        seconds: How far to push expires_at forward, counted from now for entries already expired
+        addresses: Addresses whose geocode entry is deferred
+        routes: Iterable of (origin_coords, dest_coords, mode) whose route entry is deferred
+        db_path: Optional database path (defaults to CACHE_DB_PATH)
+    """
+    now = time.time()
+    geocode_keys = [(now, seconds, address_key(address)) for address in addresses]
+    route_keys = [(now, seconds, coords_key(origin), coords_key(dest), mode) for origin, dest, mode in routes]
+    conn = _connect(db_path)
+    with conn:
+        conn.executemany('UPDATE geocodes SET expires_at = MAX(expires_at, ?) + ? WHERE address = ?', geocode_keys)
+        conn.executemany(
+            'UPDATE routes SET expires_at = MAX(expires_at, ?) + ?'
+            ' WHERE origin = ? AND destination = ? AND mode = ?', route_keys
+        )
+
+
+def parse_route_export(csv_text: str,
+                       mode: str) -> Tuple[List[Tuple[List[float], List[float], str, int, int]], int]:
+    """
+    Parse a Mass Route CSV export into route cache entries
+
+    Expected header:
+        Lat_Origin,Lng_Origin,Lat_Destination,Lng_Destination,Distance_km,Duration_HHMM,Decimal_Hours,Status
+
+    Rows that failed (Status other than OK) or cannot be parsed are skipped.
+    The export only keeps HH:MM, so durations are stored to the minute.
+
+    Args:
+        csv_text: Contents of the exported CSV
+        mode: Travel mode the export was calculated with (not part of the CSV)
+
+    Returns:
+        Tuple of (list of (origin_coords, dest_coords, mode, distance_m, duration_s),
+        number of skipped rows)
+    """
+    entries = []
+    skipped = 0
+    for row in csv.DictReader(io.StringIO(csv_text)):
+        if (row.get('Status') or '').strip() != 'OK':
+            skipped += 1
+            continue
+        try:
+            origin = [float(row['Lat_Origin']), float(row['Lng_Origin'])]
+            dest = [float(row['Lat_Destination']), float(row['Lng_Destination'])]
+            distance_m = round(float(row['Distance_km']) * 1000)
+            hours, minutes = row['Duration_HHMM'].strip().split(':')
+            duration_s = int(hours) * 3600 + int(minutes) * 60
+        except (KeyError, ValueError, AttributeError):
+            skipped += 1
+            continue
+        entries.append((origin, dest, mode, distance_m, duration_s))
+    return entries, skipped
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test untuk memverifikasi pre-filter haversine dan batching Distance Matrix
+Menguji pemilihan kandidat top-k dan batas elemen per request
+"""
+
+import math
+import random
+
+from app import (
+    MATRIX_MAX_DESTINATIONS,
+    MATRIX_MAX_ELEMENTS,
+    MATRIX_MAX_EXTRA_PER_ORIGIN,
+    MATRIX_MAX_ORIGINS,
+    batch_candidate_pairs,
+    destination_radians,
+    haversine_km,
+    nearest_candidates,
+)
+
+
+def random_candidates(origin_count, dest_count, k, seed=0):
+    rng = random.Random(seed)
+    dests = [[rng.uniform(-1, 1), rng.uniform(109, 110)] for _ in range(dest_count)]
+    origins = [[rng.uniform(-1, 1), rng.uniform(109, 110)] for _ in range(origin_count)]
+    dest_radians = destination_radians(dests)
+    return {i: nearest_candidates(origin, dest_radians, k) for i, origin in enumerate(origins)}
+
+
+def test_haversine_km():
+    """One degree of latitude is about 111.2 km"""
+    assert math.isclose(haversine_km([0, 109], [1, 109]), 111.195, abs_tol=0.01)
+    assert haversine_km([-0.0267, 109.3421], [-0.0267, 109.3421]) == 0
+
+
+def test_nearest_candidates_order():
+    """Top-k follows the known distance ranking, nearest first"""
+    origin = [0.0, 109.0]
+    # Index -> offset in degrees east of the origin: ranking is 3, 0, 4, 1, 2
+    dests = [[0.0, 109.2], [0.0, 109.5], [0.0, 110.0], [0.0, 109.1], [0.0, 108.7]]
+
+    assert nearest_candidates(origin, destination_radians(dests), 3) == [3, 0, 4]
+    assert nearest_candidates(origin, destination_radians(dests), 10) == [3, 0, 4, 1, 2]
+
+    ranking = sorted(range(len(dests)), key=lambda i: haversine_km(origin, dests[i]))
+    assert nearest_candidates(origin, destination_radians(dests), 5) == ranking
+
+
+def test_batches_respect_matrix_limits():
+    """Every batch fits in a single Distance Matrix request"""
+    for dest_count in (10, 50, 100):
+        for k in (1, 3, 10):
+            for origin_batch, dest_batch in batch_candidate_pairs(random_candidates(200, dest_count, k)):
+                assert len(origin_batch) <= MATRIX_MAX_ORIGINS
+                assert len(dest_batch) <= MATRIX_MAX_DESTINATIONS
+                assert len(origin_batch) * len(dest_batch) <= MATRIX_MAX_ELEMENTS
+
+
+def test_batches_cover_every_candidate_pair():
+    """Each origin appears once, in a batch holding all of its candidates"""
+    candidates = random_candidates(200, 50, 3)
+    seen = []
+    for origin_batch, dest_batch in batch_candidate_pairs(candidates):
+        seen.extend(origin_batch)
+        for origin_idx in origin_batch:
+            assert set(candidates[origin_idx]) <= set(dest_batch)
+
+    assert sorted(seen) == sorted(candidates)
+
+
+def test_batches_bound_total_elements():
+    """Billed elements stay within N x (k + extra), far below N x M"""
+    origin_count, k = 200, 3
+    for dest_count in (10, 20, 50, 100):
+        batches = batch_candidate_pairs(random_candidates(origin_count, dest_count, k, seed=dest_count))
+        total = sum(len(origin_batch) * len(dest_batch) for origin_batch, dest_batch in batches)
+
+        assert total <= origin_count * (k + MATRIX_MAX_EXTRA_PER_ORIGIN)
+        assert total < origin_count * dest_count
+
+
+def test_assign_nearest_rejects_invalid_top_k():
+    """topK must be a positive JSON integer"""
+    from app import app
+
+    client = app.test_client()
+    for top_k in (None, 'x', 0, -2, 1.5, True):
+        response = client.post('/api/assign-nearest', json={
+            'origins': ['Siantan, Pontianak'],
+            'destinations': ['Bandara Supadio, Pontianak'],
+            'topK': top_k
+        }).get_json()
+
+        assert response == {'success': False, 'error': 'topK must be a positive integer'}
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Test untuk memverifikasi cache warm-up dari CSV export Mass Route
+Menguji parsing CSV, penyimpanan/pembacaan cache SQLite, dan penggunaan cache oleh endpoint
+"""
+
+import os
+import time
+
+import pytest
+
+import cache
+
+EXPORT_CSV = (
+    "Lat_Origin,Lng_Origin,Lat_Destination,Lng_Destination,Distance_km,Duration_HHMM,Decimal_Hours,Status\n"
+    "-0.026700,109.342100,-0.114200,109.406500,12.84,01:30,1.50,OK\n"
+    "-,-,-,-,-,-,-,ZERO_RESULTS (Invalid Address)\n"
+)
+
+# Live geocodes return 7 decimals; the export keeps 6
+LIVE_COORDS = {
+    'jalan ahmad yani, pontianak': (-0.0267004, 109.3420996),
+    'siantan, pontianak': (0.0151203, 109.3368801),
+    'bandara supadio, pontianak': (-0.1142001, 109.4064998),
+    'pelabuhan dwikora, pontianak': (-0.0203002, 109.3381004),
+}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def test_parse_route_export():
+    """Only OK rows are parsed, with distance in meters and duration in seconds"""
+    entries, skipped = cache.parse_route_export(EXPORT_CSV, 'driving')
+
+    assert entries == [([-0.0267, 109.3421], [-0.1142, 109.4065], 'driving', 12840, 5400)]
+    assert skipped == 1
+
+
+def test_parse_route_export_counts_unparsable_rows():
+    """A file that is not a Mass Route export yields no entries"""
+    entries, skipped = cache.parse_route_export('name,address\nKantor,Jalan Gajah Mada\n', 'driving')
+
+    assert entries == []
+    assert skipped == 1
+
+
+def test_bulk_load_round_trip(tmp_path):
+    """Bulk-loaded routes and geocodes are served back from the cache"""
+    db_path = str(tmp_path / 'cache.db')
+
+    entries, _ = cache.parse_route_export(EXPORT_CSV, 'driving')
+    assert cache.put_routes(entries, db_path=db_path) == 1
+    assert cache.put_geocodes([('Jalan  Ahmad Yani, Pontianak', -0.0267, 109.3421, 'Jl. Ahmad Yani')],
+                              db_path=db_path) == 1
+
+    route = cache.get_route([-0.0267, 109.3421], [-0.1142, 109.4065], 'driving', db_path=db_path)
+    assert route == {'distance_m': 12840, 'duration_s': 5400}
+    assert cache.get_route([-0.0267, 109.3421], [-0.1142, 109.4065], 'walking', db_path=db_path) is None
+
+    geocode = cache.get_geocode('jalan ahmad yani, pontianak', db_path=db_path)
+    assert geocode['coordinates'] == [-0.0267, 109.3421]
+
+    # Fresh entries expire after CACHE_TTL_SECONDS, so they only show up in a wide window
+    assert cache.expiring_routes(60, 3600, 10, db_path=db_path) == []
+    assert len(cache.expiring_routes(cache.CACHE_TTL_SECONDS + 60, 3600, 10, db_path=db_path)) == 1
+
+
+def test_cache_recovers_from_flush(tmp_path):
+    """Deleting the cache file while running gives misses, not errors"""
+    db_path = str(tmp_path / 'cache.db')
+    cache.put_geocodes([('Siantan, Pontianak', 0.0151, 109.3369, 'Siantan')], db_path=db_path)
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    assert cache.get_geocode('Siantan, Pontianak', db_path=db_path) is None
+    assert cache.put_geocodes([('Siantan, Pontianak', 0.0151, 109.3369, 'Siantan')], db_path=db_path) == 1
+
+
+def test_only_recently_hit_entries_are_refreshed(tmp_path, monkeypatch):
+    """Unused entries are purged after expiry instead of being re-fetched forever"""
+    db_path = str(tmp_path / 'cache.db')
+    monkeypatch.setattr(cache, 'CACHE_TTL_SECONDS', 60)
+    cache.put_routes([([0, 1], [2, 3], 'driving', 1000, 60),
+                      ([4, 5], [2, 3], 'driving', 1000, 60)], db_path=db_path)
+
+    # Only the first route is hit; two minutes later both have expired
+    now = time.time()
+    monkeypatch.setattr(cache.time, 'time', lambda: now + 30)
+    assert cache.get_route([0, 1], [2, 3], 'driving', db_path=db_path) is not None
+    monkeypatch.setattr(cache.time, 'time', lambda: now + 120)
+
+    assert cache.expiring_routes(3600, 90, 10, db_path=db_path) == [([0.0, 1.0], [2.0, 3.0], 'driving')]
+    assert cache.purge_unused(90, db_path=db_path) == 1
+    assert cache.expiring_routes(3600, 3600, 10, db_path=db_path) == [([0.0, 1.0], [2.0, 3.0], 'driving')]
+
+
+def test_bulk_lookups_are_keyed_like_single_lookups(tmp_path):
+    """get_geocodes/get_routes return only cached keys, normalized the same way as put_*"""
+    db_path = str(tmp_path / 'cache.db')
+    cache.put_geocodes([('Siantan, Pontianak', 0.0151, 109.3369, 'Siantan')], db_path=db_path)
+    cache.put_routes([([0.0151203, 109.3368801], [2, 3], 'driving', 1000, 60)], db_path=db_path)
+
+    geocodes = cache.get_geocodes(['SIANTAN,  Pontianak', 'Unknown'], db_path=db_path)
+    assert list(geocodes) == ['siantan, pontianak']
+
+    routes = cache.get_routes([([0.01512, 109.33688], [2, 3]), ([4, 5], [2, 3])], 'driving', db_path=db_path)
+    assert routes == {(cache.coords_key([0.01512, 109.33688]), cache.coords_key([2, 3])):
+                      {'distance_m': 1000, 'duration_s': 60}}
+
+
+def test_failed_refresh_drops_or_defers_entries(tmp_path, monkeypatch):
+    """Entries that cannot be refreshed leave the head of the refresh queue"""
+    import app as orutego
+
+    monkeypatch.setattr(cache, 'CACHE_DB_PATH', str(tmp_path / 'cache.db'))
+    cache.put_geocodes([('Gone Street', 1, 2, 'Gone'), ('Flaky Street', 3, 4, 'Flaky')])
+    cache.put_routes([([0, 1], [2, 3], 'driving', 1000, 60)])
+
+    def fake_get(url, params=None, **kwargs):
+        if url == orutego.GEOCODE_URL and params['address'] == 'gone street':
+            return FakeResponse({'status': 'ZERO_RESULTS', 'results': []})
+        if url == orutego.GEOCODE_URL:
+            return FakeResponse({'status': 'OVER_QUERY_LIMIT', 'results': []})
+        raise orutego.requests.ConnectionError('offline')
+
+    monkeypatch.setattr(orutego.requests, 'get', fake_get)
+    window = cache.CACHE_TTL_SECONDS + 60
+    refreshed = orutego.refresh_expiring_entries('test-key', within_seconds=window, delay=0)
+
+    assert refreshed['dropped'] == 1
+    assert refreshed['deferred'] == 2
+    assert cache.get_geocode('Gone Street') is None
+    assert cache.expiring_geocodes(window, 3600, 10) == []
+    assert cache.expiring_routes(window, 3600, 10) == []
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask test client with an isolated cache and a fake Google API"""
+    import app as orutego
+
+    monkeypatch.setattr(cache, 'CACHE_DB_PATH', str(tmp_path / 'cache.db'))
+    calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        calls.append(url)
+        if url == orutego.GEOCODE_URL:
+            lat, lng = LIVE_COORDS[cache.address_key(params['address'])]
+            return FakeResponse({'status': 'OK', 'results': [{
+                'geometry': {'location': {'lat': lat, 'lng': lng}},
+                'formatted_address': params['address']
+            }]})
+        raise AssertionError(f'Unexpected API call: {url}')
+
+    monkeypatch.setattr(orutego.requests, 'get', fake_get)
+    test_client = orutego.app.test_client()
+    test_client.post('/api/save-key', json={'apiKey': 'test-key'})
+    test_client.calls = calls
+    test_client.matrix_url = orutego.DISTANCE_MATRIX_URL
+    return test_client
+
+
+def test_mass_route_hits_exported_route(client):
+    """An export row in 6-decimal format is served after a live 7-decimal geocode"""
+    cache.put_routes(cache.parse_route_export(EXPORT_CSV, 'driving')[0])
+
+    response = client.post('/api/mass-route', json={
+        'origins': ['Jalan Ahmad Yani, Pontianak'],
+        'destination': 'Bandara Supadio, Pontianak',
+        'travelMode': 'driving'
+    }).get_json()
+
+    assert response['results'][0]['success'] is True
+    assert response['results'][0]['distance'] == 12.84
+    assert response['results'][0]['duration'] == '01:30'
+    assert client.matrix_url not in client.calls
+
+
+def test_assign_nearest_uses_cached_routes(client):
+    """Cached candidates need no Distance Matrix elements"""
+    origin = LIVE_COORDS['siantan, pontianak']
+    cache.put_routes([
+        (origin, LIVE_COORDS['bandara supadio, pontianak'], 'driving', 15000, 1800),
+        (origin, LIVE_COORDS['pelabuhan dwikora, pontianak'], 'driving', 4000, 600),
+    ])
+
+    response = client.post('/api/assign-nearest', json={
+        'origins': ['Siantan, Pontianak'],
+        'destinations': ['Bandara Supadio, Pontianak', 'Pelabuhan Dwikora, Pontianak'],
+        'topK': 2
+    }).get_json()
+
+    assert response['elementsRequested'] == 0
+    assert response['results'][0]['destinationAddress'] == 'Pelabuhan Dwikora, Pontianak'
+    assert client.matrix_url not in client.calls
+
+
+def test_warm_cache_rejects_unparsable_csv(client, monkeypatch):
+    """A CSV with no usable rows is an error, not a silent success"""
+    monkeypatch.setenv('ORUTEGO_ADMIN_TOKEN', 'secret')
+
+    response = client.post('/api/admin/warm-cache', headers={'X-Admin-Token': 'secret'},
+                           json={'routeCsv': 'name,address\nKantor,Jalan Gajah Mada\n'})
+
+    assert response.status_code == 400
+    assert response.get_json()['routesSkipped'] == 1
+
+
+def test_warm_cache_checks_api_key_before_loading(client, monkeypatch):
+    """Without an API key nothing is written, routes included"""
+    monkeypatch.setenv('ORUTEGO_ADMIN_TOKEN', 'secret')
+    monkeypatch.delenv('GOOGLE_MAPS_API_KEY', raising=False)
+    import app as orutego
+
+    response = orutego.app.test_client().post('/api/admin/warm-cache', headers={'X-Admin-Token': 'secret'},
+                                              json={'routeCsv': EXPORT_CSV, 'addresses': ['Siantan, Pontianak']})
+
+    assert response.get_json()['success'] is False
+    assert cache.get_route([-0.0267, 109.3421], [-0.1142, 109.4065], 'driving') is None